@@ -1,7 +1,7 @@
 import logging
 import math
 import os
-from typing import Type, TYPE_CHECKING
+from typing import Tuple, Type, TYPE_CHECKING
 
 from pathlib import Path
 
@@ -76,6 +76,15 @@ class RenderingTask(CoreTask):
 
         self.test_task_res_path = None
 
+        # total_tasks is fixed after creation, so fragment indices are too
+        self.fragment_keys: Tuple[int, ...] = \
+            tuple(range(1, self.total_tasks + 1))
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if 'fragment_keys' not in state:
+            self.fragment_keys = tuple(range(1, self.total_tasks + 1))
+
     @CoreTask.handle_key_error
     def computation_failed(self, subtask_id: str, ban_node: bool = True):
         super().computation_failed(subtask_id, ban_node)
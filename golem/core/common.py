@@ -5,7 +5,7 @@ import subprocess
 import sys
 from calendar import timegm
 from datetime import datetime
-from functools import wraps
+from functools import lru_cache, wraps
 from typing import Any, Callable, cast, List, TypeVar
 
 import pytz
@@ -150,6 +150,7 @@ def timeout_to_string(timeout):
     return TIMEOUT_FORMAT.format(hours, minutes, timeout)
 
 
+@lru_cache(64)
 def string_to_timeout(string: str) -> int:
     values = string.split(':')
     return int(values[0]) * 3600 + int(values[1]) * 60 + int(values[2])
@@ -12,6 +12,7 @@ from ethereum.utils import denoms
 from golem_messages import helpers as msg_helpers
 from golem_messages.datastructures import masking
 from twisted.internet import defer
+from twisted.internet.threads import deferToThread
 
 from apps.core.task import coretask
 from apps.rendering.task import framerenderingtask
@@ -38,6 +39,11 @@ if typing.TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 TASK_NAME_RE = re.compile(r"(\w|[\-\. ])+$")
 
+# Enum members referenced inside per-subtask loops
+_ACTOR_REQUESTOR = Actor.Requestor
+_STATUS_FINISHED = taskstate.SubtaskStatus.finished
+_STATUS_FAILURE = taskstate.SubtaskStatus.failure
+
 
 def safe_run(errback):
     def wrapped(f):
@@ -466,6 +472,64 @@ def _restart_subtasks_error(e, _self, task_id, subtask_ids, *_args, **_kwargs) \
     return str(e)
 
 
+def _group_by_start_task(
+        fragments: typing.Dict[int, typing.List[typing.Dict]],
+        start_tasks: typing.Iterable[int],
+        subtasks: typing.Iterable[typing.Dict],
+) -> None:
+    """
+    Appends every subtask to the fragment list matching its start_task.
+    Bound methods are looked up once per fragment instead of once per subtask.
+    """
+    appenders = {key: lst.append for key, lst in fragments.items()}
+    for start_task, subtask in zip(start_tasks, subtasks):
+        appenders[start_task](subtask)
+
+
+@functools.lru_cache(64)
+def _cost_estimation_strings(
+        estimated_gnt: int,
+        estimated_eth: int,
+        estimated_deposit_eth: int,
+) -> typing.Tuple[str, str, str, str, str]:
+    """
+    Clients poll the estimation with mostly unchanged inputs, so the
+    formatted amounts are cached. A tuple can be shared between callers.
+    """
+    estimated_gnt_deposit: typing.Tuple[int, int] = \
+        msg_helpers.requestor_deposit_amount(estimated_gnt)
+    return (
+        str(estimated_gnt),
+        str(estimated_eth),
+        str(estimated_gnt_deposit[0]),
+        str(estimated_gnt_deposit[1]),
+        str(estimated_deposit_eth),
+    )
+
+
+def _format_cost_estimation(
+        estimated_gnt: int,
+        estimated_eth: int,
+        estimated_deposit_eth: int,
+) -> dict:
+    """Builds a new cost estimation RPC result, which callers may modify"""
+    gnt, eth, gnt_required, gnt_suggested, deposit_eth = \
+        _cost_estimation_strings(
+            estimated_gnt,
+            estimated_eth,
+            estimated_deposit_eth,
+        )
+    return {
+        'GNT': gnt,
+        'ETH': eth,
+        'deposit': {
+            'GNT_required': gnt_required,
+            'GNT_suggested': gnt_suggested,
+            'ETH': deposit_eth,
+        },
+    }
+
+
 def _test_task_error(e, self, task_dict, **_kwargs):
     logger.error("Test task error: %s", e)
     logger.debug("Test task details. task_dict=%s", task_dict)
@@ -722,11 +786,13 @@ class ClientProvider:
         if not task:
             return f'Task not found: {task_id!r}'
 
-        subtasks_to_restart = set(subtask_ids)
+        subtasks_to_restart = subtask_ids \
+            if isinstance(subtask_ids, (set, frozenset)) \
+            else frozenset(subtask_ids)
 
         for sub_id in subtasks_to_restart:
             if self.task_manager.subtask_to_task(
-                    sub_id, Actor.Requestor) != task_id:
+                    sub_id, _ACTOR_REQUESTOR) != task_id:
                 return f'Subtask does not belong to the given task.' \
                     f'task_id: {task_id}, subtask_id: {sub_id}'
 
@@ -799,9 +865,10 @@ class ClientProvider:
 
             finished_subtask_ids = set(
                 sub_id for sub_id, sub in old_task.subtasks_given.items()
-                if sub['status'] == taskstate.SubtaskStatus.finished
+                if sub['status'] == _STATUS_FINISHED
             )
-            subtask_ids_to_copy = finished_subtask_ids - set(subtask_ids)
+            subtask_ids_to_copy = \
+                finished_subtask_ids.difference(subtask_ids)
 
             self._validate_enough_funds_to_pay_for_task(
                 old_task.subtask_price,
@@ -866,11 +933,15 @@ class ClientProvider:
         return True
 
     @rpc_utils.expose('comp.task.subtasks.estimated.cost')
+    @defer.inlineCallbacks
     def get_estimated_subtasks_cost(
             self,
             task_id: str,
             subtask_ids: typing.List[str]
-    ) -> typing.Tuple[typing.Optional[dict], typing.Optional[str]]:
+    ) -> typing.Generator[
+            defer.Deferred,
+            typing.Any,
+            typing.Tuple[typing.Optional[dict], typing.Optional[str]]]:
         """
         Estimates the cost of restarting an array of subtasks from a given task.
         If the specified task is finished, all of the failed subtasks from that
@@ -890,18 +961,18 @@ class ClientProvider:
 
         for sub_id in subtasks_to_restart:
             if self.task_manager.subtask_to_task(
-                    sub_id, Actor.Requestor) != task_id:
+                    sub_id, _ACTOR_REQUESTOR) != task_id:
                 return None, f'Subtask does not belong to the given task.' \
                     f'task_id: {task_id}, subtask_id: {sub_id}'
 
         if self.task_manager.task_finished(task_id):
             failed_subtask_ids = set(
                 sub_id for sub_id, subtask in task.subtasks_given.items()
-                if subtask['status'] == taskstate.SubtaskStatus.failure
+                if subtask['status'] == _STATUS_FAILURE
             )
             subtasks_to_restart |= failed_subtask_ids
 
-        result = self._get_cost_estimation(
+        result = yield self._get_cost_estimation(
             len(subtasks_to_restart),
             task.subtask_price
         )
@@ -909,13 +980,17 @@ class ClientProvider:
         return result, None
 
     @rpc_utils.expose('comp.tasks.estimated.cost')
+    @defer.inlineCallbacks
     def get_estimated_cost(
             self,
             _task_type: str,
             options: typing.Optional[dict] = None,
             task_id: typing.Optional[str] = None,
             partial: typing.Optional[bool] = False
-    ) -> typing.Tuple[typing.Optional[dict], typing.Optional[str]]:
+    ) -> typing.Generator[
+            defer.Deferred,
+            typing.Any,
+            typing.Tuple[typing.Optional[dict], typing.Optional[str]]]:
         """
         Estimates the cost of a task. Result includes amounts required for both
         calculating the task, as well as creating a Concent deposit for it.
@@ -960,29 +1035,40 @@ class ClientProvider:
                 computation_time=subtask_timeout
             )
 
-        result = self._get_cost_estimation(subtask_count, subtask_price)
+        result = yield self._get_cost_estimation(subtask_count, subtask_price)
 
         logger.info('Estimated task cost. result=%r', result)
         return result, None
 
-    def _get_cost_estimation(self, subtask_count: int, subtask_price: int):
+    @defer.inlineCallbacks
+    def _get_cost_estimation(
+            self,
+            subtask_count: int,
+            subtask_price: int,
+    ) -> typing.Generator[defer.Deferred, typing.Any, dict]:
+        transaction_system = self.client.transaction_system
+        # Both estimations may query the gas price from the Ethereum node,
+        # so they run side by side in the reactor's thread pool
+        try:
+            estimated_eth, estimated_deposit_eth = yield defer.gatherResults(
+                [
+                    deferToThread(
+                        transaction_system.eth_for_batch_payment,
+                        subtask_count,
+                    ),
+                    deferToThread(transaction_system.eth_for_deposit),
+                ],
+                consumeErrors=True,
+            )
+        except defer.FirstError as e:
+            e.subFailure.raiseException()
+
         estimated_gnt: int = subtask_count * subtask_price
-        estimated_eth: int = self.client \
-            .transaction_system.eth_for_batch_payment(subtask_count)
-        estimated_gnt_deposit: typing.Tuple[int, int] = \
-            msg_helpers.requestor_deposit_amount(estimated_gnt)
-        estimated_deposit_eth: int = self.client.transaction_system \
-            .eth_for_deposit()
-
-        return {
-            'GNT': str(estimated_gnt),
-            'ETH': str(estimated_eth),
-            'deposit': {
-                'GNT_required': str(estimated_gnt_deposit[0]),
-                'GNT_suggested': str(estimated_gnt_deposit[1]),
-                'ETH': str(estimated_deposit_eth),
-            },
-        }
+        return _format_cost_estimation(
+            estimated_gnt,
+            estimated_eth,
+            estimated_deposit_eth,
+        )
 
     @rpc_utils.expose('comp.task.rendering.task_fragments')
     def get_fragments(self, task_id: str) -> \
@@ -1007,12 +1093,12 @@ class ClientProvider:
         if not isinstance(task, RenderingTask):
             return None, f"Incorrect task type: '{task.__class__.__name__}'"
 
-        fragments: typing.Dict[int, typing.List[typing.Dict]] = {}
-
-        for subtask_index in range(1, task.total_tasks + 1):
-            fragments[subtask_index] = []
+        fragments: typing.Dict[int, typing.List[typing.Dict]] = {
+            subtask_index: [] for subtask_index in task.fragment_keys
+        }
 
-        for subtask in self.task_manager.get_subtasks_dict(task_id) or []:
-            fragments[subtask['extra_data']['start_task']].append(subtask)
+        subtasks, start_tasks = \
+            self.task_manager.get_subtasks_dict_with_keys(task_id)
+        _group_by_start_task(fragments, start_tasks, subtasks)
 
         return fragments, None
@@ -15,6 +15,7 @@ from typing import (
     Iterable,
     List,
     Optional,
+    Tuple,
     Type
 )
 from zipfile import ZipFile
@@ -1106,6 +1107,21 @@ class TaskManager(TaskEventListener):
             return [subtask.to_dict() for subtask in subtasks.values()]
         return None
 
+    def get_subtasks_dict_with_keys(self, task_id: str) \
+            -> Tuple[List[Dict], List[int]]:
+        """
+        Returns the serialized subtasks of a task along with a parallel list
+        of their 'start_task' values, extracted once during serialization.
+        """
+        task_state = self.tasks_states[task_id]
+        if not task_state.subtask_states:
+            return [], []
+        subtask_states = list(task_state.subtask_states.values())
+        return (
+            [subtask.to_dict() for subtask in subtask_states],
+            [subtask.extra_data['start_task'] for subtask in subtask_states],
+        )
+
     @rpc_utils.expose('comp.task.subtasks.borders')
     def get_subtasks_borders(self, task_id, part=1):
         task = self.tasks[task_id]
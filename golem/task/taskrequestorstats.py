@@ -1,13 +1,13 @@
 import logging
 import time
-from collections import defaultdict
+from collections import Counter, defaultdict
 from threading import Lock
-from typing import NamedTuple, Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 from pydispatch import dispatcher
 
 from golem.core.statskeeper import StatsKeeper
-from golem.task.taskstate import Operation, TaskOp, SubtaskOp, \
+from golem.task.taskstate import Operation, TaskOp, SubtaskOp, OtherOp, \
     SubtaskStatus, TaskStatus, TaskState
 
 __all__ = ['RequestorTaskStatsManager']
@@ -16,11 +16,62 @@ logger = logging.getLogger(__name__)
 
 TaskMsg = NamedTuple("TaskMsg", [("ts", float), ("op", Operation)])
 
+# Membership of an op in these does not change, so it is resolved once here
+# instead of calling the Operation predicates for every message
+_ALL_OPS = [op for op_class in (TaskOp, SubtaskOp, OtherOp) for op in op_class]
+_UNNOTEWORTHY_OPS = frozenset(op for op in _ALL_OPS if op.unnoteworthy())
+_TASK_RELATED_OPS = frozenset(op for op in _ALL_OPS if op.task_related())
+_SUBTASK_RELATED_OPS = frozenset(op for op in _ALL_OPS if op.subtask_related())
+
+_TASK_START_OPS = frozenset([TaskOp.CREATED, TaskOp.RESTORED])
+_COMPLETED_TASK_OPS = frozenset(op for op in TaskOp if op.is_completed())
+_TASK_FAILURE_OPS = frozenset([TaskOp.NOT_ACCEPTED, TaskOp.TIMEOUT])
+_TASK_FAILED_STATUSES = frozenset([TaskStatus.aborted, TaskStatus.timeout])
+_SUBTASK_ASSIGNED_STATUSES = frozenset([SubtaskStatus.starting,
+                                        SubtaskStatus.downloading])
+_SUBTASK_DONE_STATUSES = frozenset([SubtaskStatus.finished,
+                                    SubtaskStatus.failure])
+# Subtask ops that end the computation and the result download, or only
+# the computation
+_SUBTASK_SETTLED_OPS = frozenset([SubtaskOp.FINISHED, SubtaskOp.NOT_ACCEPTED])
+_SUBTASK_STOPPED_OPS = frozenset([SubtaskOp.TIMEOUT, SubtaskOp.FAILED])
+
 
 class SubtaskInfo:
+    """Stores the state of a single subtask
+
+    Only the state derived from the subtask level messages is kept instead of
+    the messages themselves, see :py:meth:`apply`.
+    """
+
+    __slots__ = ('latest_status', 'computing', 'downloading')
+
     def __init__(self):
         self.latest_status = SubtaskStatus.starting
-        self.messages = []
+        # ASSIGNED not followed by TIMEOUT, FINISHED, FAILED nor NOT_ACCEPTED
+        self.computing = False
+        # RESULT_DOWNLOADING not followed by FINISHED nor NOT_ACCEPTED
+        self.downloading = False
+
+    def apply(self, op: Operation) -> None:
+        """Updates the state with a subtask level operation"""
+        if op == SubtaskOp.ASSIGNED:
+            self.computing = True
+        elif op == SubtaskOp.RESULT_DOWNLOADING:
+            self.downloading = True
+        elif op in _SUBTASK_SETTLED_OPS:
+            self.computing = self.downloading = False
+        elif op in _SUBTASK_STOPPED_OPS:
+            self.computing = False
+
+    def is_verified(self) -> bool:
+        """Has the result of the subtask been verified"""
+        return self.latest_status == SubtaskStatus.finished
+
+    def is_in_progress(self) -> bool:
+        """Is the subtask being computed, regardless of the task status"""
+        return self.computing and \
+            self.latest_status not in _SUBTASK_DONE_STATUSES
 
 
 class TaskInfo:
@@ -32,32 +83,67 @@ class TaskInfo:
     of this class with information.
     """
 
+    __slots__ = ('latest_status', '_want_to_compute_count', '_start_time',
+                 '_finish_time', '_had_task_failure', 'subtasks',
+                 '_subtask_op_count', '_verified_count', '_in_progress_count',
+                 '_not_downloaded_count', 'cached_stats')
+
     def __init__(self):
         self.latest_status = TaskStatus.notStarted  # type: TaskStatus
         self._want_to_compute_count = 0
-        self.messages = []  # type: List[TaskMsg]
+        # Timestamps of the latest start and completion messages
+        self._start_time = 0.0
+        self._finish_time = 0.0
+        # Was there any NOT_ACCEPTED or TIMEOUT task level message
+        self._had_task_failure = False
         self.subtasks = defaultdict(
             SubtaskInfo)  # type: DefaultDict[str, SubtaskInfo]
+        # Running totals over self.subtasks, updated on every subtask message
+        self._subtask_op_count = Counter()  # type: Counter[Operation]
+        self._verified_count = 0
+        self._in_progress_count = 0
+        self._not_downloaded_count = 0
+        # Stats computed from the messages received so far, None when a new
+        # message has arrived since
+        self.cached_stats = None  # type: Optional[TaskStats]
 
     def got_want_to_compute(self):
         """Makes note of a received work offer"""
         self._want_to_compute_count += 1
+        self.cached_stats = None
         logger.info('Received work offers: %r', self._want_to_compute_count)
 
     def got_task_message(self, msg: TaskMsg, latest_status: TaskStatus):
         """Stores information from task level message"""
-        self.messages.append(msg)
         self.latest_status = latest_status
+        if msg.op in _TASK_START_OPS:
+            self._start_time = msg.ts
+        elif msg.op in _COMPLETED_TASK_OPS:
+            self._finish_time = msg.ts
+        if msg.op in _TASK_FAILURE_OPS:
+            self._had_task_failure = True
+        self.cached_stats = None
 
     def got_subtask_message(self, subtask_id: str, msg: TaskMsg,
                             latest_status: SubtaskStatus):
         """Stores information from subtask level message"""
-        self.subtasks[subtask_id].latest_status = latest_status
-        self.subtasks[subtask_id].messages.append(msg)
+        subtask = self.subtasks[subtask_id]
+        was_verified = subtask.is_verified()
+        was_in_progress = subtask.is_in_progress()
+        was_downloading = subtask.downloading
+
+        subtask.latest_status = latest_status
+        subtask.apply(msg.op)
+
+        self._subtask_op_count[msg.op] += 1
+        self._verified_count += subtask.is_verified() - was_verified
+        self._in_progress_count += subtask.is_in_progress() - was_in_progress
+        self._not_downloaded_count += subtask.downloading - was_downloading
+        self.cached_stats = None
 
     def subtask_count(self) -> int:
         """Number of subtasks of this task"""
-        return len(self.subtasks.keys())
+        return len(self.subtasks)
 
     def collected_results_count(self) -> int:
         """Returns number of successfully received results
@@ -66,8 +152,8 @@ class TaskInfo:
         take "unexpected" results into account, that is results received
         which were not previously requested.
         """
-        return (self.verified_results_count() +
-                self.not_accepted_results_count())
+        aggregates = self.subtask_aggregates()
+        return aggregates.verified + aggregates.not_accepted
 
     def verified_results_count(self) -> int:
         """Number of verified results of the subtasks for self task
@@ -75,34 +161,19 @@ class TaskInfo:
         This is equal to the number of subtasks with the latest state
         ``SubtaskStatus.finished``.
         """
-        cnt = 0
-        for st in self.subtasks.values():
-            if st.latest_status == SubtaskStatus.finished:
-                cnt += 1
-        return cnt
-
-    def _subtasks_count_specific_ops(self, op: Operation):
-        cnt = 0
-        for st in self.subtasks.values():
-            for msg in st.messages:
-                if msg.op == op:
-                    cnt += 1
-        return cnt
+        return self._verified_count
 
     def not_accepted_results_count(self) -> int:
         """Number of times a subtask failed verification"""
-        return self._subtasks_count_specific_ops(
-            SubtaskOp.NOT_ACCEPTED)
+        return self.subtask_aggregates().not_accepted
 
     def timeout_count(self) -> int:
         """Number of times a subtask has not beed finished in time"""
-        return self._subtasks_count_specific_ops(
-            SubtaskOp.TIMEOUT)
+        return self.subtask_aggregates().timeout
 
     def failed_count(self) -> int:
         """Number of subtasks that failed on computing side"""
-        return self._subtasks_count_specific_ops(
-            SubtaskOp.FAILED)
+        return self.subtask_aggregates().failed
 
     def not_downloaded_count(self) -> int:
         """Returns # of subtasks that were reported as computed but their
@@ -116,18 +187,21 @@ class TaskInfo:
         also include subtasks that are actively sending results at the moment
         of a call.
         """
-        cnt = 0
-        for st in self.subtasks.values():
-            download_in_progress = False
-            for msg in st.messages:
-                if msg.op == SubtaskOp.RESULT_DOWNLOADING:
-                    download_in_progress = True
-                elif msg.op in [SubtaskOp.FINISHED,
-                                SubtaskOp.NOT_ACCEPTED]:
-                    download_in_progress = False
-            if download_in_progress:
-                cnt += 1
-        return cnt
+        return self._not_downloaded_count
+
+    def subtask_aggregates(self) -> 'SubtaskAggregates':
+        """Returns the running totals over all the subtasks
+
+        A subtask is in progress when :py:attr:`SubtaskInfo.computing` is set,
+        unless its latest status is ``finished`` or ``failure``.
+        """
+        return SubtaskAggregates(
+            verified=self._verified_count,
+            not_accepted=self._subtask_op_count[SubtaskOp.NOT_ACCEPTED],
+            timeout=self._subtask_op_count[SubtaskOp.TIMEOUT],
+            failed=self._subtask_op_count[SubtaskOp.FAILED],
+            not_downloaded=self._not_downloaded_count,
+            in_progress=self._in_progress_count)
 
     def total_time(self) -> float:
         """Returns total time in seconds spent on the task
@@ -139,21 +213,12 @@ class TaskInfo:
         latter. Note that the time spent paused is also included in
         the total time.
         """
-        start_time = 0.0
-        finish_time = 0.0
-
-        if not self.is_completed():
+        if self.is_completed():
+            finish_time = self._finish_time
+        else:
             finish_time = time.time()
 
-        for msg in reversed(self.messages):
-            if (msg.op in [TaskOp.CREATED, TaskOp.RESTORED]
-                    and not start_time):
-                start_time = msg.ts
-            elif msg.op.is_completed() and not finish_time:
-                finish_time = msg.ts
-
-        assert finish_time >= start_time
-        return finish_time - start_time
+        return finish_time - self._start_time
 
     def had_failures_or_timeouts(self) -> bool:
         """Were there any failures or timeouts during computation
@@ -161,17 +226,14 @@ class TaskInfo:
         Both failure to calculate (SUBTASK_FAILED) and failure to verify
         (SUBTASK_NOT_ACCEPTED) are considered failures in this method.
         """
-        for msg in self.messages:
-            if msg.op in [TaskOp.NOT_ACCEPTED,
-                          TaskOp.TIMEOUT]:
-                return True
-        for st in self.subtasks.values():
-            for msg in st.messages:
-                if msg.op in [SubtaskOp.FAILED,
-                              SubtaskOp.NOT_ACCEPTED,
-                              SubtaskOp.TIMEOUT]:
-                    return True
-        return False
+        return self.had_failures(self.subtask_aggregates())
+
+    def had_failures(self, aggregates: 'SubtaskAggregates') -> bool:
+        """Same as :py:meth:`had_failures_or_timeouts` but reuses already
+        computed subtask aggregates
+        """
+        return bool(aggregates.not_accepted or aggregates.timeout
+                    or aggregates.failed or self._had_task_failure)
 
     def is_completed(self) -> bool:
         """Has the task already been completed
@@ -187,7 +249,7 @@ class TaskInfo:
         from subtasks failing, which are reported via
         ``had_failures_or_timeouts()``
         """
-        return self.latest_status in [TaskStatus.aborted, TaskStatus.timeout]
+        return self.latest_status in _TASK_FAILED_STATUSES
 
     def want_to_compute_count(self) -> int:
         """How many computation offers were received for this task"""
@@ -202,24 +264,16 @@ class TaskInfo:
         """
         if self.is_completed():
             return 0
+        return self._in_progress_count
+
 
-        cnt = 0
-        for st in self.subtasks.values():
-            if st.latest_status in [SubtaskStatus.finished,
-                                    SubtaskStatus.failure]:
-                continue
-            in_progress = False
-            for msg in st.messages:
-                if msg.op == SubtaskOp.ASSIGNED:
-                    in_progress = True
-                elif msg.op in [SubtaskOp.TIMEOUT,
-                                SubtaskOp.FINISHED,
-                                SubtaskOp.FAILED,
-                                SubtaskOp.NOT_ACCEPTED]:
-                    in_progress = False
-            if in_progress:
-                cnt += 1
-        return cnt
+SubtaskAggregates = NamedTuple("SubtaskAggregates", [
+    ("verified", int),
+    ("not_accepted", int),
+    ("timeout", int),
+    ("failed", int),
+    ("not_downloaded", int),
+    ("in_progress", int)])
 
 
 TaskStats = NamedTuple("TaskStats", [("finished", bool),
@@ -261,52 +315,58 @@ Intended to be used as a summary of information from a set of
 EMPTY_CURRENT_STATS = CurrentStats(0, 0, 0, 0, 0, 0, 0, 0, 0)
 
 
-def update_current_stats_with_task(
-        current: CurrentStats,
-        old: Optional[TaskStats],
-        new: TaskStats) -> CurrentStats:
-    """Returns new :py:class:`CurrentStats` instance with changes
-    between ``old`` and ``new`` incorporated into ``current``
-
-    The ``not_downloadable_subtasks_cnt`` is only updated for tasks
-    that are finished. Since it includes tasks that are downloaded at
-    a time of a call, it would be misleading to update it earlier.
+class CurrentStatsCounter:
+    """Mutable counterpart of :py:class:`CurrentStats`
 
-    Note that ``current`` is a tuple and can't be updated in place so
-    a brand new one is returned.
+    Updated in place for every message, so that no tuple has to be built
+    until the stats are actually read via :py:meth:`snapshot`.
     """
-    is_new_task = old is None
-    if is_new_task:
-        old = EMPTY_TASK_STATS
-
-    return CurrentStats(
-        tasks_cnt=current.tasks_cnt + (1 if is_new_task else 0),
-        finished_task_cnt=(current.finished_task_cnt
-                           - (1 if old.finished else 0)
-                           + (1 if new.finished else 0)),
-        requested_subtasks_cnt=(current.requested_subtasks_cnt
-                                - old.requested_subtasks_cnt
-                                + new.requested_subtasks_cnt),
-        collected_results_cnt=(current.collected_results_cnt
-                               - old.collected_results_cnt
-                               + new.collected_results_cnt),
-        verified_results_cnt=(current.verified_results_cnt
-                              - old.verified_results_cnt
-                              + new.verified_results_cnt),
-        timed_out_subtasks_cnt=(current.timed_out_subtasks_cnt
-                                - old.timed_out_subtasks_cnt
-                                + new.timed_out_subtasks_cnt),
-        not_downloadable_subtasks_cnt=(
-            current.not_downloadable_subtasks_cnt
-            - (old.not_downloaded_subtasks_cnt if old.finished else 0)
-            + (new.not_downloaded_subtasks_cnt if new.finished else 0)),
-        failed_subtasks_cnt=(current.failed_subtasks_cnt
-                             - old.failed_subtasks_cnt
-                             + new.failed_subtasks_cnt),
-        work_offers_cnt=(current.work_offers_cnt
-                         - old.work_offers_cnt
-                         + new.work_offers_cnt)
-    )
+
+    __slots__ = CurrentStats._fields
+
+    def __init__(self) -> None:
+        self.tasks_cnt = 0
+        self.finished_task_cnt = 0
+        self.requested_subtasks_cnt = 0
+        self.failed_subtasks_cnt = 0
+        self.collected_results_cnt = 0
+        self.verified_results_cnt = 0
+        self.timed_out_subtasks_cnt = 0
+        self.not_downloadable_subtasks_cnt = 0
+        self.work_offers_cnt = 0
+
+    def snapshot(self) -> CurrentStats:
+        return CurrentStats(*(getattr(self, field)
+                              for field in self.__slots__))
+
+    def update_with_task(self,
+                         old: Optional[TaskStats],
+                         new: TaskStats) -> None:
+        """Incorporates changes between ``old`` and ``new``
+
+        The ``not_downloadable_subtasks_cnt`` is only updated for tasks
+        that are finished. Since it includes tasks that are downloaded at
+        a time of a call, it would be misleading to update it earlier.
+        """
+        if old is None:
+            self.tasks_cnt += 1
+            old = EMPTY_TASK_STATS
+
+        self.finished_task_cnt += new.finished - old.finished
+        self.requested_subtasks_cnt += (new.requested_subtasks_cnt
+                                        - old.requested_subtasks_cnt)
+        self.collected_results_cnt += (new.collected_results_cnt
+                                       - old.collected_results_cnt)
+        self.verified_results_cnt += (new.verified_results_cnt
+                                      - old.verified_results_cnt)
+        self.timed_out_subtasks_cnt += (new.timed_out_subtasks_cnt
+                                        - old.timed_out_subtasks_cnt)
+        self.not_downloadable_subtasks_cnt += (
+            (new.not_downloaded_subtasks_cnt if new.finished else 0)
+            - (old.not_downloaded_subtasks_cnt if old.finished else 0))
+        self.failed_subtasks_cnt += (new.failed_subtasks_cnt
+                                     - old.failed_subtasks_cnt)
+        self.work_offers_cnt += new.work_offers_cnt - old.work_offers_cnt
 
 
 FinishedTasksSummary = NamedTuple("FinishedTaskSummary", [
@@ -338,44 +398,54 @@ def update_finished_stats_with_task(
         finished: FinishedTasksStats,
         old: Optional[TaskStats],
         new: TaskStats) -> FinishedTasksStats:
-    mid = finished
+    if not new.finished and not (old and old.finished):
+        return finished
+
+    ok_cnt, ok_time = finished.finished_ok
+    with_failures_cnt, with_failures_time = finished.finished_with_failures
+    failed_cnt, failed_time = finished.failed
+
     if old and old.finished:
         if old.task_failed:
-            mid = finished._replace(
-                failed=FinishedTasksSummary(
-                    tasks_cnt=finished.failed.tasks_cnt - 1,
-                    total_time=finished.failed.total_time - old.total_time))
+            failed_cnt -= 1
+            failed_time -= old.total_time
         elif old.had_failures:
-            mid = finished._replace(
-                finished_with_failures=FinishedTasksSummary(
-                    tasks_cnt=finished.finished_with_failures.tasks_cnt - 1,
-                    total_time=(finished.finished_with_failures.total_time
-                                - old.total_time)))
+            with_failures_cnt -= 1
+            with_failures_time -= old.total_time
         else:
-            mid = finished._replace(
-                finished_ok=FinishedTasksSummary(
-                    tasks_cnt=finished.finished_ok.tasks_cnt - 1,
-                    total_time=(finished.finished_ok.total_time
-                                - old.total_time)))
-    ret = mid
+            ok_cnt -= 1
+            ok_time -= old.total_time
     if new.finished:
         if new.task_failed:
-            ret = mid._replace(
-                failed=FinishedTasksSummary(
-                    tasks_cnt=mid.failed.tasks_cnt + 1,
-                    total_time=mid.failed.total_time + new.total_time))
+            failed_cnt += 1
+            failed_time += new.total_time
         elif new.had_failures:
-            ret = mid._replace(
-                finished_with_failures=FinishedTasksSummary(
-                    tasks_cnt=mid.finished_with_failures.tasks_cnt + 1,
-                    total_time=(mid.finished_with_failures.total_time
-                                + new.total_time)))
+            with_failures_cnt += 1
+            with_failures_time += new.total_time
         else:
-            ret = mid._replace(
-                finished_ok=FinishedTasksSummary(
-                    tasks_cnt=mid.finished_ok.tasks_cnt + 1,
-                    total_time=mid.finished_ok.total_time + new.total_time))
-    return ret
+            ok_cnt += 1
+            ok_time += new.total_time
+
+    return FinishedTasksStats(
+        finished_ok=FinishedTasksSummary(ok_cnt, ok_time),
+        finished_with_failures=FinishedTasksSummary(
+            with_failures_cnt, with_failures_time),
+        failed=FinishedTasksSummary(failed_cnt, failed_time))
+
+
+PendingMessage = NamedTuple("PendingMessage", [
+    ("ts", float),
+    ("task_id", str),
+    ("task_status", TaskStatus),
+    ("op", Operation),
+    ("subtask_statuses", Tuple[Tuple[str, SubtaskStatus], ...])])
+PendingMessage.__doc__ = """A message waiting to be applied to the stats
+
+The statuses are copied from the ``TaskState`` on arrival, as the state
+object keeps changing afterwards. ``subtask_statuses`` holds the status of
+the single subtask of a subtask level message and of all subtasks for
+``TaskOp.RESTORED``.
+"""
 
 
 class RequestorTaskStats:
@@ -385,80 +455,118 @@ class RequestorTaskStats:
     by the user via ``on_message`` method and has two methods,
     :py:meth:`get_current_stats` and :py:meth:`get_finished_stats`, that are
     used for extracting information from it.
+
+    Received messages are only queued and applied in batches when any of
+    the stats are read. Completed tasks are moved out of ``tasks`` into a
+    separate dict, so that ``tasks`` holds only the ones in progress.
     """
 
     def __init__(self):
         self.tasks = defaultdict(
             TaskInfo)  # type: DefaultDict[str, TaskInfo]
-        self.stats = EMPTY_CURRENT_STATS
+        self._finished_tasks = {}  # type: Dict[str, TaskInfo]
+        self.stats = CurrentStatsCounter()
         self.finished_stats = EMPTY_FINISHED_STATS
+        self._pending = []  # type: List[PendingMessage]
+        self._lock = Lock()
 
     def on_message(self,
                    task_id: str,
                    task_state: TaskState,
                    subtask_id: str = None,
                    op: Operation = None) -> None:
-        """Updates stats according to the received information."""
+        """Queues the received information for updating the stats"""
+
+        if not op or op in _UNNOTEWORTHY_OPS:
+            # Nothing is recorded, so the stats cannot change
+            return
+        if op not in _TASK_RELATED_OPS and op not in _SUBTASK_RELATED_OPS:
+            # Unknown operation, log problem
+            logger.debug("Unknown operation %r", op.name)
+            return
+        if op == TaskOp.RESTORED and task_state.status.is_completed():
+            logger.debug("Skipping completed task %r", task_id)
+            return
 
-        old_task_stats = None
-        if task_id in self.tasks:
-            old_task_stats = self.get_task_stats(task_id)
+        if op == TaskOp.RESTORED:
+            subtask_statuses = tuple(
+                (s_id, subtask_state.status)
+                for s_id, subtask_state in task_state.subtask_states.items())
+        elif op in _SUBTASK_RELATED_OPS:
+            assert subtask_id
+            subtask_statuses = (
+                (subtask_id, task_state.subtask_states[subtask_id].status),)
+        else:
+            subtask_statuses = ()
 
-        if not op or op.unnoteworthy():
-            pass
+        msg = PendingMessage(ts=time.time(), task_id=task_id,
+                             task_status=task_state.status, op=op,
+                             subtask_statuses=subtask_statuses)
+        with self._lock:
+            self._pending.append(msg)
 
-        elif op == TaskOp.WORK_OFFER_RECEIVED:
-            self.tasks[task_id].got_want_to_compute()
+    def _flush(self) -> None:
+        """Applies the queued messages
+
+        Stats of every affected task are computed once before and once after
+        the whole batch, no matter how many of its messages were queued.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+
+            old_task_stats = {}  # type: Dict[str, Optional[TaskStats]]
+            for msg in pending:
+                task_id = msg.task_id
+                if task_id not in old_task_stats:
+                    ti = self.tasks.get(task_id)
+                    if ti is None:
+                        # A late message for a completed task
+                        ti = self._finished_tasks.pop(task_id, None)
+                        if ti is not None:
+                            self.tasks[task_id] = ti
+                    old_task_stats[task_id] = \
+                        None if ti is None else self._get_task_info_stats(ti)
+                self._apply(self.tasks[task_id], msg)
+
+            for task_id, old_stats in old_task_stats.items():
+                new_stats = self._get_task_info_stats(self.tasks[task_id])
+                self.stats.update_with_task(old_stats, new_stats)
+                self.finished_stats = update_finished_stats_with_task(
+                    self.finished_stats, old_stats, new_stats)
+                if new_stats.finished:
+                    self._finished_tasks[task_id] = self.tasks.pop(task_id)
+
+    @staticmethod
+    def _apply(ti: TaskInfo, msg: PendingMessage) -> None:
+        op = msg.op
+        if op == TaskOp.WORK_OFFER_RECEIVED:
+            ti.got_want_to_compute()
 
         elif op == TaskOp.RESTORED:
-            if task_state.status.is_completed():
-                logger.debug("Skipping completed task %r", task_id)
-            else:
-                the_time = time.time()
-                for s_id in task_state.subtask_states.keys():
-                    subtask_status = (task_state.subtask_states[s_id]
-                                      .status)
-                    self.tasks[task_id].got_subtask_message(
-                        s_id,
-                        TaskMsg(ts=the_time, op=SubtaskOp.RESTARTED),
-                        subtask_status)
-                    if subtask_status in [SubtaskStatus.starting,
-                                          SubtaskStatus.downloading]:
-                        self.tasks[task_id].got_subtask_message(
-                            s_id,
-                            TaskMsg(ts=the_time, op=SubtaskOp.ASSIGNED),
-                            subtask_status)
-
-                msg = TaskMsg(ts=the_time, op=TaskOp.RESTORED)
-                self.tasks[task_id].got_task_message(msg, task_state.status)
-
-        elif op.task_related():
-            self.tasks[task_id].got_task_message(
-                TaskMsg(ts=time.time(), op=op),
-                task_state.status)
-
-        elif op.subtask_related():
-            assert subtask_id
-            self.tasks[task_id].got_subtask_message(
-                subtask_id,
-                TaskMsg(ts=time.time(), op=op),
-                task_state.subtask_states[subtask_id].status)
+            # Messages are immutable, so one of each kind serves all subtasks
+            restarted_msg = TaskMsg(ts=msg.ts, op=SubtaskOp.RESTARTED)
+            assigned_msg = TaskMsg(ts=msg.ts, op=SubtaskOp.ASSIGNED)
+            for s_id, subtask_status in msg.subtask_statuses:
+                ti.got_subtask_message(s_id, restarted_msg, subtask_status)
+                if subtask_status in _SUBTASK_ASSIGNED_STATUSES:
+                    ti.got_subtask_message(s_id, assigned_msg, subtask_status)
 
-        else:
-            # Unknown operation, log problem
-            logger.debug("Unknown operation %r", op.name)
+            ti.got_task_message(TaskMsg(ts=msg.ts, op=op), msg.task_status)
 
-        if task_id in self.tasks:
-            new_task_stats = self.get_task_stats(task_id)
-            self.stats = update_current_stats_with_task(
-                self.stats, old_task_stats, new_task_stats)
-            self.finished_stats = update_finished_stats_with_task(
-                self.finished_stats, old_task_stats, new_task_stats)
+        elif op in _TASK_RELATED_OPS:
+            ti.got_task_message(TaskMsg(ts=msg.ts, op=op), msg.task_status)
+
+        else:
+            (subtask_id, subtask_status), = msg.subtask_statuses
+            ti.got_subtask_message(
+                subtask_id, TaskMsg(ts=msg.ts, op=op), subtask_status)
 
     def is_task_finished(self, task_id: str) -> bool:
         """Returns True for a known, completed task"""
-        ti = self.tasks.get(task_id)
-        return bool(ti and ti.is_completed())
+        self._flush()
+        return task_id in self._finished_tasks
 
     def get_task_stats(self, task_id: str) -> TaskStats:
         """Returns statistical information about a single task
@@ -467,26 +575,43 @@ class RequestorTaskStats:
         will then be final. It will work on the task in progress, but
         some fields like ``not_downloaded_subtasks_cnt`` can decrease.
         """
-        ti = self.tasks[task_id]  # type: TaskInfo
-        return TaskStats(
-            finished=ti.is_completed(),
-            task_failed=ti.has_task_failed(),
-            total_time=ti.total_time(),
-            had_failures=ti.had_failures_or_timeouts(),
-            work_offers_cnt=ti.want_to_compute_count(),
-            requested_subtasks_cnt=ti.subtask_count(),
-            collected_results_cnt=ti.collected_results_count(),
-            verified_results_cnt=ti.verified_results_count(),
-            timed_out_subtasks_cnt=ti.timeout_count(),
-            not_downloaded_subtasks_cnt=ti.not_downloaded_count(),
-            failed_subtasks_cnt=ti.failed_count())
+        self._flush()
+        ti = self._finished_tasks.get(task_id)
+        if ti is None:
+            ti = self.tasks[task_id]
+        return self._get_task_info_stats(ti)
+
+    @staticmethod
+    def _get_task_info_stats(ti: TaskInfo) -> TaskStats:
+        if ti.cached_stats is None:
+            aggregates = ti.subtask_aggregates()
+            ti.cached_stats = TaskStats(
+                finished=ti.is_completed(),
+                task_failed=ti.has_task_failed(),
+                total_time=ti.total_time(),
+                had_failures=ti.had_failures(aggregates),
+                work_offers_cnt=ti.want_to_compute_count(),
+                requested_subtasks_cnt=ti.subtask_count(),
+                collected_results_cnt=(aggregates.verified
+                                       + aggregates.not_accepted),
+                verified_results_cnt=aggregates.verified,
+                timed_out_subtasks_cnt=aggregates.timeout,
+                not_downloaded_subtasks_cnt=aggregates.not_downloaded,
+                failed_subtasks_cnt=aggregates.failed)
+        elif not ti.is_completed():
+            # Wall time of a task in progress keeps growing
+            ti.cached_stats = ti.cached_stats._replace(
+                total_time=ti.total_time())
+        return ti.cached_stats
 
     def get_current_stats(self) -> CurrentStats:
         """Returns information about current state of requested tasks."""
-        return self.stats
+        self._flush()
+        return self.stats.snapshot()
 
     def get_finished_stats(self) -> FinishedTasksStats:
         """Returns stats about tasks that had been finished."""
+        self._flush()
         return self.finished_stats
 
 
@@ -495,7 +620,7 @@ class AggregateTaskStats:
     def __init__(self, **kwargs):
         # Number of subtasks paid (batch transfers)
         self.requestor_payment_cnt: int = 0
-        # Average batch payment delay
+        # Average batch payment delay, computed on read from the sum and count
         self.requestor_payment_delay_avg: float = 0.0
         # Sum of batch payment delays
         self.requestor_payment_delay_sum: float = 0.0
@@ -517,8 +642,8 @@ class RequestorAggregateStatsManager:
 
     def __init__(self):
         self.keeper = StatsKeeper(AggregateTaskStats, default_value='0')
-        self._payment_lock = Lock()
         self._computed_lock = Lock()
+        self._payment_lock = Lock()
 
         dispatcher.connect(self._on_computed,
                            signal='golem.subtask')
@@ -552,19 +677,22 @@ class RequestorAggregateStatsManager:
 
         delay = kwargs.get('delay')
 
+        # Each increment is atomic on its own, the lock keeps the pair
+        # consistent for get_stats(), which derives the average from it
         with self._payment_lock:
-            _, payment_cnt = self.keeper.get_stats(
-                'requestor_payment_cnt')
-            _, payment_delay_sum = self.keeper.get_stats(
-                'requestor_payment_delay_sum')
+            self.keeper.increase_stat('requestor_payment_cnt', 1)
+            self.keeper.increase_stat('requestor_payment_delay_sum', delay)
 
-            new_cnt = payment_cnt + 1
-            new_sum = payment_delay_sum + delay
-            new_avg = new_sum / new_cnt
-
-            self.keeper.set_stat('requestor_payment_cnt', new_cnt)
-            self.keeper.set_stat('requestor_payment_delay_sum', new_sum)
-            self.keeper.set_stat('requestor_payment_delay_avg', new_avg)
+    def get_stats(self) -> AggregateTaskStats:
+        """Returns a copy of the global stats with the average payment delay
+        filled in"""
+        with self._payment_lock:
+            stats = AggregateTaskStats(**vars(self.keeper.global_stats))
+        payment_cnt = stats.requestor_payment_cnt
+        stats.requestor_payment_delay_avg = (
+            stats.requestor_payment_delay_sum / payment_cnt
+            if payment_cnt else 0.0)
+        return stats
 
 
 class RequestorTaskStatsManager:
@@ -604,4 +732,5 @@ class RequestorTaskStatsManager:
         return self.requestor_stats.get_finished_stats()
 
     def get_aggregate_stats(self) -> AggregateTaskStats:
-        return self.aggregate_stats.keeper.global_stats
+        """See :py:meth:`RequestorAggregateStatsManager.get_stats`"""
+        return self.aggregate_stats.get_stats()
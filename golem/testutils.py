@@ -1,15 +1,19 @@
 import asyncio
+import atexit
+import functools
+import itertools
 import logging
 import os
 import os.path
 import shutil
+import subprocess
 import tempfile
+import threading
 import unittest
+from collections import deque
 from pathlib import Path
 from time import sleep
-
-import ethereum.keys
-import pycodestyle
+from typing import Optional
 
 from golem.core.common import get_golem_path, is_windows, is_osx
 from golem.core.simpleenv import get_local_datadir
@@ -18,14 +22,85 @@ from golem.model import DB_MODELS, db, DB_FIELDS
 
 logger = logging.getLogger(__name__)
 
+_GOLEM_PATH = Path(get_golem_path())
+
+# Unique suffixes of the files and dirs created by additional_dir_content
+_file_counter = itertools.count()
+
+
+def _next_file_name() -> str:
+    return 'tmp{}_{}'.format(os.getpid(), next(_file_counter))
+
+
+def _remove_dir(path: str) -> None:
+    """Removes a large tree. Small ones are faster to remove with rmtree"""
+    if not os.path.isdir(path):
+        return
+    # Native tools are many times faster than shutil.rmtree on large trees
+    if is_windows():
+        cmd = ['cmd', '/c', 'rd', '/s', '/q', path]
+    else:
+        cmd = ['rm', '-rf', path]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        shutil.rmtree(path)
+        return
+    if os.path.isdir(path):
+        raise OSError(result.returncode,
+                      result.stderr.decode(errors='replace').strip(),
+                      path)
+
+
+def _list_dir_tree(path: str, limit: int = 200) -> str:
+    """Lists at most `limit` entries under `path`, breadth first"""
+    lines = []
+    dirs = deque([path])
+    while dirs:
+        if len(lines) >= limit:
+            lines.append('...')
+            break
+        current = dirs.popleft()
+        lines.append(current)
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if len(lines) >= limit:
+                        lines.append('...')
+                        return '\n'.join(lines)
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    else:
+                        lines.append(entry.name)
+        except OSError:
+            continue
+    return '\n'.join(lines)
+
+
+def _mkdtemp(prefix: str, dir_: Optional[str]) -> str:
+    tempdir = tempfile.mkdtemp(prefix=prefix, dir=dir_)
+    if not is_windows():
+        os.chmod(tempdir, 0o770)
+    return tempdir
+
 
 class TempDirFixture(unittest.TestCase):
     root_dir = None
+    # Set to True to create every test's dir with mkdtemp directly in
+    # root_dir instead of as a subdir of a dir shared by the test case
+    PER_TEST_TEMPDIR = False
 
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
         logging.basicConfig(level=logging.DEBUG)
+
+        # Imported here, as it is slow to import and not every test needs it
+        import ethereum.keys
+        # KeysAuth uses it. Default val (250k+) slows down the tests terribly
+        ethereum.keys.PBKDF2_CONSTANTS['c'] = 1
+
         if cls.root_dir is None:
             if is_osx():
                 # Use Golem's working directory in ~/Library/Application Support
@@ -42,22 +117,42 @@ class TempDirFixture(unittest.TestCase):
                 # Select nice root temp dir exactly once.
                 cls.root_dir = tempfile.mkdtemp(prefix='golem-tests-')
 
-    # Concurrent tests will fail
-    # @classmethod
-    # def tearDownClass(cls):
-    #     if os.path.exists(cls.root_dir):
-    #         shutil.rmtree(cls.root_dir)
+        # The reactor fixtures call setUpClass of these fixtures unbound.
+        # They have no tests to share a class dir with
+        if not cls.PER_TEST_TEMPDIR \
+                and cls not in (TempDirFixture, DatabaseFixture):
+            cls._class_tempdir = _mkdtemp(cls.__name__, cls.root_dir)
 
-    def setUp(self):
-
-        # KeysAuth uses it. Default val (250k+) slows down the tests terribly
-        ethereum.keys.PBKDF2_CONSTANTS['c'] = 1
+    # root_dir is not removed, concurrent tests would fail
+    @classmethod
+    def tearDownClass(cls):
+        class_tempdir = cls.__dict__.get('_class_tempdir')
+        if class_tempdir:
+            del cls._class_tempdir
+            try:
+                _remove_dir(class_tempdir)
+            except OSError as e:
+                logger.error("Failed to remove %r: %r", class_tempdir, e)
+        super().tearDownClass()
 
-        prefix = self.id().rsplit('.', 1)[1]  # Use test method name
-        self.tempdir = tempfile.mkdtemp(prefix=prefix, dir=self.root_dir)
+    def setUp(self):
+        test_id = self.id()
+        name = test_id[test_id.rfind('.') + 1:]  # Use test method name
+        class_tempdir = type(self).__dict__.get('_class_tempdir')
+        if class_tempdir is None:
+            self.tempdir = _mkdtemp(name, self.root_dir)
+        else:
+            if not is_windows():
+                # Makes os.mkdir create dirs with the 0o770 mode. The umask is
+                # process-wide, so it is set per test and restored by a
+                # cleanup, which runs even if a subclass' setUp fails
+                self.addCleanup(os.umask, os.umask(0o007))
+            self.tempdir = os.path.join(class_tempdir, name)
+            try:
+                os.mkdir(self.tempdir)
+            except FileExistsError:  # Left over by a failed teardown
+                self.tempdir = _mkdtemp(name, class_tempdir)
         self.path = self.tempdir  # Alias for legacy tests
-        if not is_windows():
-            os.chmod(self.tempdir, 0o770)
         self.new_path = Path(self.path)
 
     def tearDown(self):
@@ -66,19 +161,21 @@ class TempDirFixture(unittest.TestCase):
             self.__remove_files()
         except OSError as e:
             logger.debug("%r", e, exc_info=True)
-            tree = ''
-            for path, _dirs, files in os.walk(self.path):
-                tree += path + '\n'
-                for f in files:
-                    tree += f + '\n'
-            logger.error("Failed to remove files %r", tree)
+            logger.error("Failed to remove files %r", _list_dir_tree(self.path))
             # Tie up loose ends.
             import gc
             gc.collect()
             # On windows there's sometimes a problem with syncing all threads.
-            # Try again after 3 seconds
-            sleep(3)
-            self.__remove_files()
+            # Most handles are released quickly, so retry with growing delays
+            delays = (0.05, 0.15, 0.5, 1.5)
+            for attempt, delay in enumerate(delays, 1):
+                sleep(delay)
+                try:
+                    self.__remove_files()
+                    return
+                except OSError:
+                    if attempt == len(delays):
+                        raise
 
     def temp_file_name(self, name: str) -> str:
         return os.path.join(self.tempdir, name)
@@ -110,10 +207,13 @@ class TempDirFixture(unittest.TestCase):
         for el in file_num_list:
             if isinstance(el, int):
                 for _ in range(el):
-                    t = tempfile.NamedTemporaryFile(dir=dir_, delete=False)
-                    results.append(t.name)
+                    path = os.path.join(dir_, _next_file_name())
+                    os.close(os.open(
+                        path, os.O_CREAT | os.O_WRONLY | os.O_EXCL, 0o600))
+                    results.append(path)
             else:
-                new_dir = tempfile.mkdtemp(dir=dir_)
+                new_dir = os.path.join(dir_, _next_file_name())
+                os.mkdir(new_dir, 0o700)
                 self.additional_dir_content(el, new_dir, results)
         return results
 
@@ -143,6 +243,14 @@ class TestWithClient(TempDirFixture):
         self.client.datadir = os.path.join(self.path, "datadir")
 
 
+@functools.lru_cache(maxsize=1)
+def _style_guide():
+    import pycodestyle
+    return pycodestyle.StyleGuide(
+        ignore=pycodestyle.DEFAULT_IGNORE.split(','),
+        max_line_length=80)
+
+
 class PEP8MixIn(object):
     """A mix-in class that adds PEP-8 style conformance.
     To use it in your TestCase just add it to inheritance list like so:
@@ -158,21 +266,39 @@ class PEP8MixIn(object):
 
     def test_conformance(self, *_):
         """Test that we conform to PEP-8."""
-        style = pycodestyle.StyleGuide(
-            ignore=pycodestyle.DEFAULT_IGNORE.split(','),
-            max_line_length=80)
+        style = _style_guide()
+        # The guide is shared, so the error counts must not be
+        style.init_report()
 
         # PyCharm needs absolute paths
-        base_path = Path(get_golem_path())
-        absolute_files = [str(base_path / path) for path in self.PEP8_FILES]
+        absolute_files = [str(_GOLEM_PATH / path) for path in self.PEP8_FILES]
 
         result = style.check_files(absolute_files)
         self.assertEqual(result.total_errors, 0,
                          "Found code style errors (and warnings).")
 
 
+_shared_loop = None  # type: Optional[asyncio.AbstractEventLoop]
+_shared_loop_lock = threading.Lock()
+
+
+def _get_shared_loop() -> asyncio.AbstractEventLoop:
+    global _shared_loop  # pylint: disable=global-statement
+    if _shared_loop is None or _shared_loop.is_closed():
+        _shared_loop = asyncio.new_event_loop()
+    return _shared_loop
+
+
+@atexit.register
+def _close_shared_loop() -> None:
+    if _shared_loop is not None and not _shared_loop.is_closed():
+        _shared_loop.close()
+
+
 def async_test(coro):
+    @functools.wraps(coro)
     def wrapper(*args, **kwargs):
-        loop = asyncio.new_event_loop()
-        return loop.run_until_complete(coro(*args, **kwargs))
+        with _shared_loop_lock:
+            loop = _get_shared_loop()
+            return loop.run_until_complete(coro(*args, **kwargs))
     return wrapper
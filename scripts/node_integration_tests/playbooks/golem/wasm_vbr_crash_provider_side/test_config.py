@@ -11,6 +11,7 @@ extend_enum(NodeId, 'provider4', 'provider4')
 extend_enum(NodeId, 'provider5', 'provider5')
 
 THIS_DIR: Path = Path(__file__).resolve().parent
+TASKS_DIR: Path = (THIS_DIR.parents[2] / 'tasks').resolve()
 
 
 class TestConfig(TestConfigBase):
@@ -38,10 +39,7 @@ class TestConfig(TestConfigBase):
             task_package_name=self.task_package,
             task_settings=self.task_settings,
         )
-        cwd = Path(__file__).resolve().parent
         self.task_dict['options']['input_dir'] =\
-            str((cwd / '..' / '..' / '..' / 'tasks' / self.task_package /
-                'in').resolve())
+            str(TASKS_DIR / self.task_package / 'in')
         self.task_dict['options']['output_dir'] =\
-            str((cwd / '..' / '..' / '..' / 'tasks' / self.task_package /
-                 'out').resolve())
+            str(TASKS_DIR / self.task_package / 'out')
@@ -10,6 +10,9 @@ from scripts.node_integration_tests import helpers
 
 extend_enum(NodeId, 'provider2', 'provider2')
 
+TASKS_DIR: pathlib.Path = \
+    (pathlib.Path(__file__).resolve().parents[3] / 'tasks').resolve()
+
 
 class TestConfig(TestConfigBase):
     def __init__(self, *, task_settings: str = 'WASM_g_flite') -> None:
@@ -25,10 +28,7 @@ class TestConfig(TestConfigBase):
             task_package_name=self.task_package,
             task_settings=self.task_settings,
         )
-        cwd = pathlib.Path(__file__).resolve().parent
         self.task_dict['options']['input_dir'] =\
-            str((cwd / '..' / '..' / '..' / 'tasks' / self.task_package /
-                'in').resolve())
+            str(TASKS_DIR / self.task_package / 'in')
         self.task_dict['options']['output_dir'] =\
-            str((cwd / '..' / '..' / '..' / 'tasks' / self.task_package /
-                'out').resolve())
+            str(TASKS_DIR / self.task_package / 'out')
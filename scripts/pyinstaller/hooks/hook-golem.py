@@ -1,10 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from PyInstaller.utils.hooks import collect_submodules
 
-hiddenimports = collect_submodules('golem') + \
-                collect_submodules('apps') + \
-                collect_submodules('dns') + \
-                collect_submodules('os_win') + \
-                ['Cryptodome', 'xml', 'scrypt', 'mock']
+# Every collect_submodules call imports its package in a child process,
+# so the four packages are walked in parallel
+_PACKAGES = ('golem', 'apps', 'dns', 'os_win')
+
+with ThreadPoolExecutor(max_workers=len(_PACKAGES)) as executor:
+    hiddenimports = [module
+                     for modules in executor.map(collect_submodules, _PACKAGES)
+                     for module in modules]
+
+hiddenimports += ['Cryptodome', 'xml', 'scrypt', 'mock']
 
 datas = [
     ('loggingconfig.py', '.'),
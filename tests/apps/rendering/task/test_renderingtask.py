@@ -191,6 +191,14 @@ class TestRenderingTask(TestDirFixture, LogTestCase):
         task.last_task = 10
         assert task._get_next_task() is None
 
+    def test_setstate_without_fragment_keys(self):
+        # State of a task pickled before fragment_keys were introduced
+        state = self.task.__getstate__()
+        del state['fragment_keys']
+        task = RenderingTaskMock.__new__(RenderingTaskMock)
+        task.__setstate__(state)
+        assert task.fragment_keys == tuple(range(1, 101))
+
     def test_update_task_preview_ioerror(self):
         e = OpenCVError("test message")
         with patch("apps.rendering.resources.imgrepr.OpenCVImgRepr."
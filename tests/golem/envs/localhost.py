@@ -1,17 +1,24 @@
 import asyncio
+import ctypes
 import logging
+import multiprocessing
+import os
 import signal
-from multiprocessing import Process
 from pathlib import Path
-from typing import Optional, Dict, Any, Tuple, List, Awaitable, Callable
+from typing import (
+    Optional, Dict, Any, Tuple, List, Awaitable, Callable, Union
+)
 
 import dill
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from golem_task_api import RequestorAppHandler, ProviderAppHandler, entrypoint
 from golem_task_api.structs import Subtask
 from twisted.internet import defer, threads
+from twisted.internet.interfaces import IReadDescriptor
+from twisted.internet.main import CONNECTION_DONE
+from zope.interface import implementer
 
-from golem.core.common import is_windows
+from golem.core.common import is_linux, is_windows
 from golem.envs import (
     CounterId,
     CounterUsage,
@@ -29,7 +36,26 @@ from golem.envs import (
 )
 from golem.task.task_api import TaskApiPayloadBuilder
 
-logger = logging.getLogger(__name__)
+# Forking saves the servers from re-importing everything this module needs
+_MP_CONTEXT = multiprocessing.get_context(
+    'spawn' if is_windows() else 'fork')
+
+_PR_SET_PDEATHSIG = 1  # From <linux/prctl.h>
+
+
+def _die_with_parent(parent_pid: int) -> None:
+    """ Makes the kernel kill the calling process once its parent exits, so
+        a crashed test run does not leave app servers behind (Linux only).
+        The kernel actually tracks the parent *thread*, i.e. the one which
+        started the process, so it has to live as long as the server. """
+    libc = ctypes.CDLL(None, use_errno=True)  # libc is already loaded
+    if libc.prctl(_PR_SET_PDEATHSIG, signal.SIGKILL) != 0:
+        logging.getLogger(__name__).warning(
+            'prctl(PR_SET_PDEATHSIG) failed: %s',
+            os.strerror(ctypes.get_errno()))
+    # The parent may have died before prctl, then no signal would come
+    if os.getppid() != parent_pid:
+        os._exit(1)  # pylint: disable=protected-access
 
 
 class LocalhostConfig(EnvConfig):
@@ -39,7 +65,11 @@ class LocalhostConfig(EnvConfig):
 
     @staticmethod
     def from_dict(data: dict) -> 'LocalhostConfig':
-        return LocalhostConfig()
+        # The config holds no state, so every parsed config is the same one
+        return _EMPTY_CONFIG
+
+
+_EMPTY_CONFIG = LocalhostConfig()
 
 
 async def _not_implemented(*_):
@@ -56,7 +86,14 @@ class LocalhostPrerequisites(Prerequisites):
         _not_implemented
 
     def to_dict(self) -> dict:
-        return asdict(self)
+        # Not asdict(), which would deep copy every callable
+        return {
+            'compute': self.compute,
+            'run_benchmark': self.run_benchmark,
+            'next_subtask': self.next_subtask,
+            'has_pending_subtasks': self.has_pending_subtasks,
+            'verify': self.verify,
+        }
 
     @staticmethod
     def from_dict(data: dict) -> 'LocalhostPrerequisites':
@@ -66,6 +103,7 @@ class LocalhostPrerequisites(Prerequisites):
 @dataclass
 class LocalhostPayload(RuntimePayload):
     command: str
+    argv: Tuple[str, ...]
     shared_dir: Path
     prerequisites: LocalhostPrerequisites
 
@@ -83,6 +121,7 @@ class LocalhostPayloadBuilder(TaskApiPayloadBuilder):
         assert isinstance(prereq, LocalhostPrerequisites)
         return LocalhostPayload(
             command=command,
+            argv=tuple(command.split()),
             shared_dir=shared_dir,
             prerequisites=prereq
         )
@@ -134,50 +173,111 @@ class LocalhostAppHandler(RequestorAppHandler, ProviderAppHandler):
             subtask_id, subtask_params)
 
 
+@implementer(IReadDescriptor)
+class _ProcessSentinelReader:
+    """ Calls back once the process owning the sentinel exits. The sentinel
+        is a pipe closed by the exiting process, so the reactor watches it
+        like a socket and loses the 'connection' then. """
+
+    def __init__(self, sentinel: int, on_exit: Callable[[], None]) -> None:
+        self._sentinel = sentinel
+        self._on_exit = on_exit
+
+    def fileno(self) -> int:
+        return self._sentinel
+
+    def doRead(self):
+        # Nothing is ever written, so being readable means EOF
+        return CONNECTION_DONE
+
+    def connectionLost(self, reason) -> None:
+        self._on_exit()
+
+    def logPrefix(self) -> str:
+        return self.__class__.__name__
+
+
 class LocalhostRuntime(RuntimeBase):
 
     def __init__(
             self,
             payload: LocalhostPayload,
     ) -> None:
-        super().__init__(logger)
-
-        self._server_process = Process(
+        super().__init__(logging.getLogger(__name__))
+
+        # A forked child inherits the payload as it is. Otherwise it has to
+        # be serialized with dill, as the prerequisites are usually closures
+        payload_arg: Union[LocalhostPayload, bytes] = payload
+        if _MP_CONTEXT.get_start_method() != 'fork':
+            payload_arg = dill.dumps(payload)
+        self._server_process = _MP_CONTEXT.Process(
             target=self._spawn_server,
-            args=(dill.dumps(payload),),
+            args=(payload_arg, list(payload.argv), os.getpid()),
             daemon=True
         )
         self._shutdown_deferred: Optional[defer.Deferred] = None
+        # Registered with the reactor until the server process exits
+        self._sentinel_reader: Optional[_ProcessSentinelReader] = None
+        # Set by stop(), when a non-zero exit code is expected
+        self._stop_requested = False
 
     def prepare(self) -> defer.Deferred:
         self._prepared()
         return defer.succeed(None)
 
     def clean_up(self) -> defer.Deferred:
+        self._unwatch_server_sentinel()
         self._torn_down()
         return defer.succeed(None)
 
     @staticmethod
-    def _spawn_server(payload_str: str) -> None:
+    def _spawn_server(
+            payload: Union['LocalhostPayload', bytes],
+            argv: List[str],
+            parent_pid: int
+    ) -> None:
+        if is_linux():
+            _die_with_parent(parent_pid)
         server_loop = asyncio.new_event_loop()
-        if not is_windows():  # Signals don't work on Windows
-            server_loop.add_signal_handler(signal.SIGTERM, server_loop.stop)
         asyncio.set_event_loop(server_loop)
 
-        payload: LocalhostPayload = dill.loads(payload_str)
+        if isinstance(payload, bytes):
+            payload = dill.loads(payload)
+        server_loop.run_until_complete(
+            LocalhostRuntime._serve(payload, argv))
+
+    @staticmethod
+    async def _serve(payload: 'LocalhostPayload', argv: List[str]) -> None:
+        shutdown = asyncio.Event()
+        if not is_windows():  # Signals don't work on Windows
+            asyncio.get_event_loop().add_signal_handler(
+                signal.SIGTERM, shutdown.set)
+
         app_handler = LocalhostAppHandler(payload.prerequisites)
-        server_loop.run_until_complete(entrypoint(
+        server = asyncio.ensure_future(entrypoint(
             work_dir=payload.shared_dir,
-            argv=payload.command.split(),
+            argv=argv,
             requestor_handler=app_handler,
             provider_handler=app_handler
         ))
+        shutdown_requested = asyncio.ensure_future(shutdown.wait())
+        await asyncio.wait(
+            [server, shutdown_requested],
+            return_when=asyncio.FIRST_COMPLETED)
+
+        # Let the server tear down instead of stopping the loop under it
+        shutdown_requested.cancel()
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
 
     def _wait_for_server_shutdown(self):
         try:
             self._server_process.join()
             exit_code = self._server_process.exitcode
-            if exit_code != 0:
+            if exit_code != 0 and not self._stop_requested:
                 raise RuntimeError(
                     f'Server process exited with exit code {exit_code}')
         except Exception as e:  # pylint: disable=broad-except
@@ -187,14 +287,47 @@ class LocalhostRuntime(RuntimeBase):
 
     def start(self) -> defer.Deferred:
         self._server_process.start()
-        self._shutdown_deferred = threads.deferToThread(
-            self._wait_for_server_shutdown)
+        if is_windows():  # The sentinel is a handle, not a descriptor
+            self._shutdown_deferred = threads.deferToThread(
+                self._wait_for_server_shutdown)
+        else:
+            self._shutdown_deferred = self._watch_server_sentinel()
         self._started()
         return defer.succeed(None)
 
-    def stop(self) -> defer.Deferred:
+    def _watch_server_sentinel(self) -> defer.Deferred:
+        from twisted.internet import reactor
+        deferred = defer.Deferred()
+
+        def on_exit():
+            # The reactor has already dropped the reader
+            self._sentinel_reader = None
+            # The process has exited, so join() only reaps it
+            self._wait_for_server_shutdown()
+            deferred.callback(None)
+
+        self._sentinel_reader = _ProcessSentinelReader(
+            self._server_process.sentinel, on_exit)
+        reactor.addReader(self._sentinel_reader)  # pylint: disable=no-member
+        return deferred
+
+    def _unwatch_server_sentinel(self) -> None:
+        if self._sentinel_reader is None:
+            return
+        from twisted.internet import reactor
+        reactor.removeReader(  # pylint: disable=no-member
+            self._sentinel_reader)
+        self._sentinel_reader = None
+
+    def stop(self, force: bool = False) -> defer.Deferred:
+        """ With force=True the server is killed without a graceful shutdown.
+            terminate() already does that on Windows. """
+        self._stop_requested = True
         try:
-            self._server_process.terminate()
+            if force and not is_windows():
+                os.kill(self._server_process.pid, signal.SIGKILL)
+            else:
+                self._server_process.terminate()
         except Exception:  # pylint: disable=broad-except
             return defer.fail()
         return defer.succeed(None)
@@ -233,7 +366,7 @@ class LocalhostEnvironment(EnvironmentBase):
             config: LocalhostConfig,
             env_id: EnvId = 'localhost'
     ) -> None:
-        super().__init__(logger)
+        super().__init__(logging.getLogger(__name__))
         self._config = config
         self._env_id = env_id
 
@@ -13,13 +13,15 @@ from twisted.trial.unittest import TestCase as TwistedTestCase
 
 from golem.core.common import install_reactor
 from golem.core.deferred import deferred_from_future
+from golem.envs import RuntimeStatus
 from golem.task.task_api import EnvironmentTaskApiService
 from golem.tools.testwithreactor import uninstall_reactor
 from tests.golem.envs.localhost import (
     LocalhostEnvironment,
     LocalhostConfig,
     LocalhostPrerequisites,
-    LocalhostPayloadBuilder
+    LocalhostPayloadBuilder,
+    LocalhostRuntime
 )
 
 
@@ -47,6 +49,18 @@ class TestLocalhostEnv(TwistedTestCase):
             shared_dir=Path('whatever')
         )
 
+    @staticmethod
+    def _get_runtime(service: TaskApiService) -> LocalhostRuntime:
+        runtime = service._runtime  # pylint: disable=protected-access
+        assert isinstance(runtime, LocalhostRuntime)
+        return runtime
+
+    @inlineCallbacks
+    def _stop_runtime(self, service: TaskApiService):
+        runtime = self._get_runtime(service)
+        yield runtime.stop()
+        yield runtime.wait_until_stopped()
+
     @inlineCallbacks
     def test_compute_ok(self):
         subtask_id = 'test_subtask'
@@ -69,6 +83,7 @@ class TestLocalhostEnv(TwistedTestCase):
         ))
         result = yield deferred_from_future(compute_future)
         self.assertEqual(result, Path(result_path))
+        yield self._stop_runtime(service)
 
     @inlineCallbacks
     def test_compute_interrupted(self):
@@ -86,9 +101,23 @@ class TestLocalhostEnv(TwistedTestCase):
             subtask_id='test_subtask',
             subtask_params={'param': 'value'}
         ))
-        yield service._runtime.stop()  # pylint: disable=protected-access
+        runtime = self._get_runtime(service)
+        yield runtime.stop(force=True)
         with self.assertRaises((OSError, StreamTerminatedError)):
             yield deferred_from_future(compute_future)
+        yield runtime.wait_until_stopped()
+
+    @inlineCallbacks
+    def test_wait_until_stopped(self):
+        service = self._get_service(LocalhostPrerequisites())
+        client_future = asyncio.ensure_future(ProviderAppClient.create(service))
+        yield deferred_from_future(client_future)
+        runtime = self._get_runtime(service)
+
+        yield runtime.stop()
+        yield runtime.wait_until_stopped()
+
+        self.assertEqual(runtime.status(), RuntimeStatus.STOPPED)
 
     @inlineCallbacks
     def test_benchmark(self):
@@ -104,6 +133,7 @@ class TestLocalhostEnv(TwistedTestCase):
         benchmark_future = asyncio.ensure_future(client.run_benchmark())
         result = yield deferred_from_future(benchmark_future)
         self.assertAlmostEqual(result, benchmark_result, places=5)
+        yield self._stop_runtime(service)
 
     @inlineCallbacks
     def test_subtasks(self):
@@ -147,6 +177,7 @@ class TestLocalhostEnv(TwistedTestCase):
 
         shutdown_future = asyncio.ensure_future(client.shutdown())
         yield deferred_from_future(shutdown_future)
+        yield self._get_runtime(service).wait_until_stopped()
 
     @inlineCallbacks
     def test_verify(self):
@@ -177,3 +208,4 @@ class TestLocalhostEnv(TwistedTestCase):
 
         shutdown_future = asyncio.ensure_future(client.shutdown())
         yield deferred_from_future(shutdown_future)
+        yield self._get_runtime(service).wait_until_stopped()
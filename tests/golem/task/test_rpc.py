@@ -895,10 +895,19 @@ class TestGetEstimatedCost(ProviderBase):
         self.task = Mock()
         self.provider.task_manager.tasks[self.task_id] = self.task
 
+        patcher = mock.patch('golem.task.rpc.deferToThread',
+                             side_effect=defer.execute)
+        self.defer_to_thread = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get_estimated_cost(self, *args, **kwargs):
+        return golem_deferred.sync_wait(
+            self.provider.get_estimated_cost(*args, **kwargs))
+
     def test_basic(self, *_):
         subtasks = 5
 
-        result, error = self.provider.get_estimated_cost(
+        result, error = self._get_estimated_cost(
             "task type",
             options={
                 "price": '150',
@@ -925,11 +934,40 @@ class TestGetEstimatedCost(ProviderBase):
         )
         self.transaction_system.eth_for_deposit.assert_called_once_with()
 
+    def test_transaction_system_calls_deferred_to_thread(self, *_):
+        self.task.get_total_tasks.return_value = 3
+        self.task.subtask_price = 1
+
+        result, error = self._get_estimated_cost(
+            'task_type',
+            task_id=self.task_id
+        )
+
+        self.assertIsNone(error)
+        self.assertCountEqual(
+            self.defer_to_thread.call_args_list,
+            [
+                call(self.transaction_system.eth_for_batch_payment, 3),
+                call(self.transaction_system.eth_for_deposit),
+            ],
+        )
+        self.assertEqual(result['ETH'], '10000')
+        self.assertEqual(result['deposit']['ETH'], '20000')
+
+    def test_transaction_system_error(self, *_):
+        self.task.get_total_tasks.return_value = 3
+        self.task.subtask_price = 1
+        self.transaction_system.eth_for_deposit.side_effect = \
+            exceptions.EthereumError('Test')
+
+        with self.assertRaises(exceptions.EthereumError):
+            self._get_estimated_cost('task_type', task_id=self.task_id)
+
     def test_full_restart(self, *_):
         self.task.get_total_tasks.return_value = 10
         self.task.subtask_price = 1
 
-        result, error = self.provider.get_estimated_cost(
+        result, error = self._get_estimated_cost(
             "task_type",
             task_id=self.task_id
         )
@@ -952,7 +990,7 @@ class TestGetEstimatedCost(ProviderBase):
         self.task.get_tasks_left.return_value = 2
         self.task.subtask_price = 2
 
-        result, error = self.provider.get_estimated_cost(
+        result, error = self._get_estimated_cost(
             'task_type',
             task_id=self.task_id,
             partial=True
@@ -975,7 +1013,7 @@ class TestGetEstimatedCost(ProviderBase):
     def test_task_non_found(self, *_):
         task_id = 'non-existent-uuid'
 
-        result, error = self.provider.get_estimated_cost(
+        result, error = self._get_estimated_cost(
             'task_type',
             task_id=task_id,
             partial=True
@@ -985,7 +1023,7 @@ class TestGetEstimatedCost(ProviderBase):
         self.assertEqual(error, f'Task not found: {task_id}')
 
     def test_no_parameters(self, *_):
-        result, error = self.provider.get_estimated_cost('task_type')
+        result, error = self._get_estimated_cost('task_type')
 
         self.assertIsNone(result)
         self.assertEqual(
@@ -1010,10 +1048,19 @@ class TestGetEstimatedSubtasksCost(ProviderBase):
         self.provider.task_manager.subtask2task_mapping = \
             {sub_id: self.task_id for sub_id in self.subtask_ids}
 
+        patcher = mock.patch('golem.task.rpc.deferToThread',
+                             side_effect=defer.execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get_estimated_subtasks_cost(self, *args, **kwargs):
+        return golem_deferred.sync_wait(
+            self.provider.get_estimated_subtasks_cost(*args, **kwargs))
+
     @mock.patch('golem.task.taskmanager.TaskManager.task_finished',
                 return_value=False)
     def test_active_task(self, *_):
-        result, error = self.provider.get_estimated_subtasks_cost(
+        result, error = self._get_estimated_subtasks_cost(
             task_id=self.task_id,
             subtask_ids=self.subtask_ids
         )
@@ -1042,7 +1089,7 @@ class TestGetEstimatedSubtasksCost(ProviderBase):
             {sub_id: self.task_id for sub_id in self.subtask_ids}
         self.task.subtasks_given = subtasks_given
 
-        result, error = self.provider.get_estimated_subtasks_cost(
+        result, error = self._get_estimated_subtasks_cost(
             task_id=self.task_id,
             subtask_ids=self.subtask_ids
         )
@@ -1064,7 +1111,7 @@ class TestGetEstimatedSubtasksCost(ProviderBase):
     def test_subtask_mismatch(self, *_):
         subtask_ids = ['im-not-from-this-task']
 
-        result, error = self.provider.get_estimated_subtasks_cost(
+        result, error = self._get_estimated_subtasks_cost(
             task_id=self.task_id,
             subtask_ids=subtask_ids
         )
@@ -1077,7 +1124,7 @@ class TestGetEstimatedSubtasksCost(ProviderBase):
     def test_task_not_found(self, *_):
         task_id = 'task-which-doesnt-exist'
 
-        result, error = self.provider.get_estimated_subtasks_cost(
+        result, error = self._get_estimated_subtasks_cost(
             task_id=task_id,
             subtask_ids=self.subtask_ids
         )
@@ -1092,7 +1139,7 @@ class TestGetEstimatedSubtasksCost(ProviderBase):
         self.provider.task_manager.subtask2task_mapping = \
             {sub_id: self.task_id for sub_id in subtask_ids}
 
-        result, error = self.provider.get_estimated_subtasks_cost(
+        result, error = self._get_estimated_subtasks_cost(
             task_id=self.task_id,
             subtask_ids=subtask_ids
         )
@@ -1112,6 +1159,47 @@ class TestGetEstimatedSubtasksCost(ProviderBase):
         )
 
 
+class TestGroupByStartTask(unittest.TestCase):
+    def test_subtasks_grouped(self):
+        fragments = {1: [], 2: [], 3: []}
+        subtasks = [{'subtask_id': str(i)} for i in range(4)]
+
+        rpc._group_by_start_task(fragments, [1, 3, 3, 1], subtasks)
+
+        self.assertEqual(fragments, {
+            1: [subtasks[0], subtasks[3]],
+            2: [],
+            3: [subtasks[1], subtasks[2]],
+        })
+
+    def test_no_subtasks(self):
+        fragments = {1: [], 2: []}
+
+        rpc._group_by_start_task(fragments, [], [])
+
+        self.assertEqual(fragments, {1: [], 2: []})
+
+
+class TestFormatCostEstimation(unittest.TestCase):
+    def test_repeated_inputs(self):
+        first = rpc._format_cost_estimation(10, 10000, 20000)
+        second = rpc._format_cost_estimation(10, 10000, 20000)
+
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        self.assertIsNot(first['deposit'], second['deposit'])
+
+    def test_modified_result_not_shared(self):
+        first = rpc._format_cost_estimation(10, 10000, 20000)
+        first['GNT'] = 'modified'
+        first['deposit']['extra'] = 'value'
+
+        second = rpc._format_cost_estimation(10, 10000, 20000)
+
+        self.assertEqual(second['GNT'], '10')
+        self.assertNotIn('extra', second['deposit'])
+
+
 class TestGetFragments(ProviderBase):
     def _create_task(self) -> taskbase.Task:
         task = self.client.task_manager.create_task(self.t_dict)
@@ -1162,6 +1250,7 @@ class TestGetFragments(ProviderBase):
         subtask_count = 5
         mock_task = Mock(spec=RenderingTask)
         mock_task.total_tasks = subtask_count
+        mock_task.fragment_keys = tuple(range(1, subtask_count + 1))
         mock_task_state = Mock()
         mock_task_state.subtask_states = None
         tm = self.provider.task_manager
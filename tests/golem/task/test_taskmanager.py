@@ -955,6 +955,24 @@ class TestTaskManager(LogTestCase, TestDatabaseWithReactor,  # noqa # pylint: di
         tm.get_task_preview(task_id)
         assert get_preview.called
 
+    def test_get_subtasks_dict_with_keys(self, *_):
+        task_state = TaskState()
+        for start_task in (2, 1, 2):
+            subtask = taskstate_factory.SubtaskState()
+            subtask.extra_data = {'start_task': start_task}
+            task_state.subtask_states[subtask.subtask_id] = subtask
+        self.tm.tasks_states['task_id'] = task_state
+
+        subtasks, start_tasks = self.tm.get_subtasks_dict_with_keys('task_id')
+
+        assert start_tasks == [2, 1, 2]
+        assert [s['extra_data']['start_task'] for s in subtasks] == \
+            start_tasks
+
+    def test_get_subtasks_dict_with_keys_no_subtasks(self, *_):
+        self.tm.tasks_states['task_id'] = TaskState()
+        assert self.tm.get_subtasks_dict_with_keys('task_id') == ([], [])
+
     @patch('golem.network.p2p.local_node.LocalNode.collect_network_info')
     def test_get_subtasks_borders(self, *_):
         count = 3
@@ -5,7 +5,7 @@ from unittest.mock import Mock, patch
 from pydispatch import dispatcher
 
 from golem import testutils
-from golem.task.taskrequestorstats import TaskInfo, TaskMsg, \
+from golem.task.taskrequestorstats import TaskInfo, SubtaskInfo, TaskMsg, \
     RequestorTaskStats, logger, CurrentStats, TaskStats, EMPTY_TASK_STATS, \
     FinishedTasksStats, FinishedTasksSummary, RequestorTaskStatsManager, \
     EMPTY_CURRENT_STATS, EMPTY_FINISHED_STATS, AggregateTaskStats, \
@@ -263,6 +263,29 @@ class TestTaskInfo(TestCase, testutils.PEP8MixIn):
         self.assertTrue(ti.had_failures_or_timeouts(),
                         "One subtask should have failed")
 
+    def test_subtask_info_state(self):
+        si = SubtaskInfo()
+        self.assertFalse(si.computing)
+        self.assertFalse(si.downloading)
+
+        si.apply(SubtaskOp.ASSIGNED)
+        self.assertTrue(si.is_in_progress())
+        si.apply(SubtaskOp.TIMEOUT)
+        self.assertFalse(si.computing, "Timed out subtask is not computed")
+
+        si.apply(SubtaskOp.RESTARTED)
+        si.apply(SubtaskOp.ASSIGNED)
+        si.apply(SubtaskOp.RESULT_DOWNLOADING)
+        self.assertTrue(si.computing)
+        self.assertTrue(si.downloading)
+
+        si.latest_status = SubtaskStatus.failure
+        self.assertFalse(si.is_in_progress())
+
+        si.apply(SubtaskOp.NOT_ACCEPTED)
+        self.assertFalse(si.computing)
+        self.assertFalse(si.downloading)
+
 
 class TestRequestorTaskStats(LogTestCase):
     def compare_task_stats(self, ts1, ts2):
@@ -606,6 +629,53 @@ class TestRequestorTaskStats(LogTestCase):
                              FinishedTasksSummary(1, ftime4)))
         self.assertGreaterEqual(ftime4, ftime3, "Time should not go back")
 
+    def test_task_stats_cache(self):
+        rs = RequestorTaskStats()
+        ts1 = self.create_task_and_taskstate(rs, "task1")
+        self.add_subtask(rs, "task1", ts1, "st1.1")
+
+        stats1 = rs.get_task_stats("task1")
+        stats2 = rs.get_task_stats("task1")
+        self.compare_task_stats(stats2, stats1)
+        self.assertEqual(stats2.requested_subtasks_cnt, 1)
+
+        # a new message invalidates the cached stats
+        self.add_subtask(rs, "task1", ts1, "st1.2")
+        stats3 = rs.get_task_stats("task1")
+        self.assertEqual(stats3.requested_subtasks_cnt, 2)
+
+    def test_messages_applied_on_read(self):
+        rs = RequestorTaskStats()
+        ts1 = self.create_task_and_taskstate(rs, "task1")
+        self.add_subtask(rs, "task1", ts1, "st1.1")
+        self.finish_subtask(rs, "task1", ts1, "st1.1")
+        self.finish_task(rs, "task1", ts1)
+
+        # messages are only queued until the stats are read
+        self.assertEqual(len(rs.tasks), 0)
+
+        # statuses are taken from the time the messages arrived
+        ts1.status = TaskStatus.waiting
+        self.assertTrue(rs.is_task_finished("task1"))
+        self.assertEqual(rs.get_current_stats(),
+                         CurrentStats(1, 1, 1, 1, 1, 0, 0, 0, 1))
+
+    def test_finished_tasks_moved_out(self):
+        rs = RequestorTaskStats()
+        ts1 = self.create_task_and_taskstate(rs, "task1")
+        self.add_subtask(rs, "task1", ts1, "st1.1")
+        self.finish_subtask(rs, "task1", ts1, "st1.1")
+        self.finish_task(rs, "task1", ts1)
+
+        self.assertTrue(rs.is_task_finished("task1"))
+        self.assertNotIn("task1", rs.tasks)
+
+        # a late message is still taken into account
+        self.add_subtask(rs, "task1", ts1, "st1.2")
+        self.assertEqual(rs.get_task_stats("task1").requested_subtasks_cnt, 2)
+        self.assertTrue(rs.is_task_finished("task1"))
+        self.assertNotIn("task1", rs.tasks)
+
     def test_unknown_op(self):
         rs = RequestorTaskStats()
 
@@ -843,8 +913,7 @@ class TestRequestorAggregateStatsManager(TestCase):
 
     def test_on_payment_ignored_event(self):
         self.manager._on_payment(event='ignored')
-        assert not self.manager.keeper.get_stats.called
-        assert not self.manager.keeper.set_stat.called
+        assert not self.manager.keeper.increase_stat.called
 
     def test_on_payment(self):
         kwargs = dict(
@@ -854,12 +923,25 @@ class TestRequestorAggregateStatsManager(TestCase):
         )
 
         self.manager._on_payment(event='confirmed', **kwargs)
-        retrieved = self.manager.keeper.retrieved_stats
-        replaced = self.manager.keeper.replaced_stats
+        increased = self.manager.keeper.increased_stats
 
-        assert 'requestor_payment_cnt' in retrieved
-        assert 'requestor_payment_delay_sum' in retrieved
+        assert increased['requestor_payment_cnt'] == 1
+        assert increased['requestor_payment_delay_sum'] == kwargs['delay']
+        assert 'requestor_payment_delay_avg' not in increased
+        assert not self.manager.keeper.set_stat.called
 
-        assert replaced['requestor_payment_cnt'] != 0
-        assert replaced['requestor_payment_delay_sum'] != 0
-        assert replaced['requestor_payment_delay_avg'] != 0
+    def test_get_stats(self):
+        self.manager.keeper.global_stats = AggregateTaskStats(
+            requestor_payment_cnt=4,
+            requestor_payment_delay_sum=10.0,
+        )
+        stats = self.manager.get_stats()
+        assert stats.requestor_payment_delay_avg == 2.5
+        assert stats is not self.manager.keeper.global_stats
+        assert self.manager.keeper.global_stats.requestor_payment_delay_avg \
+            == 0.0
+
+    def test_get_stats_no_payments(self):
+        self.manager.keeper.global_stats = AggregateTaskStats()
+        stats = self.manager.get_stats()
+        assert stats.requestor_payment_delay_avg == 0.0
@@ -2,6 +2,8 @@ import pycodestyle
 from pathlib import Path
 from golem.core.common import get_golem_path
 
+_GOLEM_PATH = Path(get_golem_path())
+
 
 class Pep8ConformanceTest(object):
     PEP8_FILES = []
@@ -22,8 +24,7 @@ class Pep8ConformanceTest(object):
         style = pycodestyle.StyleGuide(ignore=[], max_line_length=120)
 
         # PyCharm needs absolute paths
-        base_path = Path(get_golem_path())
-        absolute_files = [str(base_path / path) for path in self.PEP8_FILES]
+        absolute_files = [str(_GOLEM_PATH / path) for path in self.PEP8_FILES]
 
         result = style.check_files(absolute_files)
         self.assertEqual(result.total_errors, 0,